@@ -4,10 +4,16 @@ import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime
 import json
+import heapq
+import re
+import os
+import tempfile
 import time
 import uuid
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import xlsxwriter
 
 # ==========================================
 # AN.AI AHMED NOUFAL Construction Management System
@@ -117,6 +123,7 @@ st.markdown("""
 class ANAIDatabase:
     def __init__(self):
         self.db_key = 'anai_db_v1'
+        self.schedule_key = 'anai_schedules_v1'
         self.init_database()
     
     def init_database(self):
@@ -155,6 +162,9 @@ class ANAIDatabase:
                     'currency': 'sar'
                 }
             }
+        if self.schedule_key not in st.session_state:
+            # CPM engines per project, kept out of the exported data
+            st.session_state[self.schedule_key] = {}
     
     def add_project(self, project_data):
         project_id = f"project_{int(time.time())}"
@@ -165,6 +175,38 @@ class ANAIDatabase:
     def get_projects(self):
         return st.session_state[self.db_key]['projects']
     
+    def get_schedule(self, project_id):
+        schedules = st.session_state[self.schedule_key]
+        if project_id not in schedules:
+            project = self.get_projects()[project_id]
+            if not project.get('activities'):
+                return None
+            schedules[project_id] = CPMSchedule(project['activities'])
+            project['progress'] = round(schedules[project_id].percent_complete)
+        return schedules[project_id]
+    
+    def save_activities(self, project_id, activities):
+        project = self.get_projects()[project_id]
+        old = project.get('activities', {})
+        schedule = st.session_state[self.schedule_key].get(project_id)
+        same_network = schedule is not None and old.keys() == activities.keys() and all(
+            old[a]['predecessors'] == activities[a]['predecessors'] and old[a]['name'] == activities[a]['name']
+            for a in activities
+        )
+        
+        if same_network:
+            # Only durations or progress changed - update the schedule incrementally
+            for activity_id, activity in activities.items():
+                if (activity['duration'], activity['progress']) != (old[activity_id]['duration'], old[activity_id]['progress']):
+                    schedule.update_activity(activity_id, activity['duration'], activity['progress'])
+        else:
+            schedule = CPMSchedule(activities)
+            st.session_state[self.schedule_key][project_id] = schedule
+        
+        project['activities'] = activities
+        project['progress'] = round(schedule.percent_complete)
+        return schedule
+    
     def save_analysis(self, analysis_id, analysis_data):
         analysis_data['timestamp'] = datetime.now().isoformat()
         st.session_state[self.db_key]['analyses'][analysis_id] = analysis_data
@@ -190,10 +232,665 @@ class ANAIDatabase:
         try:
             data = json.loads(data_json)
             st.session_state[self.db_key] = data
+            st.session_state[self.schedule_key] = {}
             return True, "تم استيراد البيانات بنجاح"
         except Exception as e:
             return False, f"خطأ في استيراد البيانات: {str(e)}"
 
+# Material properties (E in Pa, allowable stress in Pa, density in kg/m3)
+# and the maximum column slenderness ratio KL/r
+MATERIALS = {
+    "خرسانة مسلحة": {'E': 30e9, 'allowable_stress': 25e6, 'density': 2400, 'slenderness_limit': 100},
+    "صلب": {'E': 200e9, 'allowable_stress': 250e6, 'density': 7850, 'slenderness_limit': 200},
+    "خشب": {'E': 12e9, 'allowable_stress': 40e6, 'density': 600, 'slenderness_limit': 170},
+}
+
+# Standard steel I-sections: name -> (h, b, tw, tf) in mm
+STEEL_SHAPES = {
+    'IPE 80': (80, 46, 3.8, 5.2), 'IPE 100': (100, 55, 4.1, 5.7),
+    'IPE 120': (120, 64, 4.4, 6.3), 'IPE 140': (140, 73, 4.7, 6.9),
+    'IPE 160': (160, 82, 5.0, 7.4), 'IPE 180': (180, 91, 5.3, 8.0),
+    'IPE 200': (200, 100, 5.6, 8.5), 'IPE 220': (220, 110, 5.9, 9.2),
+    'IPE 240': (240, 120, 6.2, 9.8), 'IPE 270': (270, 135, 6.6, 10.2),
+    'IPE 300': (300, 150, 7.1, 10.7), 'IPE 330': (330, 160, 7.5, 11.5),
+    'IPE 360': (360, 170, 8.0, 12.7), 'IPE 400': (400, 180, 8.6, 13.5),
+    'IPE 450': (450, 190, 9.4, 14.6), 'IPE 500': (500, 200, 10.2, 16.0),
+    'IPE 550': (550, 210, 11.1, 17.2), 'IPE 600': (600, 220, 12.0, 19.0),
+    'HEA 100': (96, 100, 5.0, 8.0), 'HEA 120': (114, 120, 5.0, 8.0),
+    'HEA 140': (133, 140, 5.5, 8.5), 'HEA 160': (152, 160, 6.0, 9.0),
+    'HEA 180': (171, 180, 6.0, 9.5), 'HEA 200': (190, 200, 6.5, 10.0),
+    'HEA 220': (210, 220, 7.0, 11.0), 'HEA 240': (230, 240, 7.5, 12.0),
+    'HEA 260': (250, 260, 7.5, 12.5), 'HEA 280': (270, 280, 8.0, 13.0),
+    'HEA 300': (290, 300, 8.5, 14.0), 'HEA 320': (310, 300, 9.0, 15.5),
+    'HEA 340': (330, 300, 9.5, 16.5), 'HEA 360': (350, 300, 10.0, 17.5),
+    'HEA 400': (390, 300, 11.0, 19.0), 'HEA 450': (440, 300, 11.5, 21.0),
+    'HEA 500': (490, 300, 12.0, 23.0), 'HEA 550': (540, 300, 12.5, 24.0),
+    'HEA 600': (590, 300, 13.0, 25.0),
+    'HEB 100': (100, 100, 6.0, 10.0), 'HEB 120': (120, 120, 6.5, 11.0),
+    'HEB 140': (140, 140, 7.0, 12.0), 'HEB 160': (160, 160, 8.0, 13.0),
+    'HEB 180': (180, 180, 8.5, 14.0), 'HEB 200': (200, 200, 9.0, 15.0),
+    'HEB 220': (220, 220, 9.5, 16.0), 'HEB 240': (240, 240, 10.0, 17.0),
+    'HEB 260': (260, 260, 10.0, 17.5), 'HEB 280': (280, 280, 10.5, 18.0),
+    'HEB 300': (300, 300, 11.0, 19.0), 'HEB 320': (320, 300, 11.5, 20.5),
+    'HEB 340': (340, 300, 12.0, 21.5), 'HEB 360': (360, 300, 12.5, 22.5),
+    'HEB 400': (400, 300, 13.5, 24.0), 'HEB 450': (450, 300, 14.0, 26.0),
+    'HEB 500': (500, 300, 14.5, 28.0), 'HEB 550': (550, 300, 15.0, 29.0),
+    'HEB 600': (600, 300, 15.5, 30.0),
+}
+
+# Common rectangular sizes in mm: material -> (widths, depths)
+RECT_SIZES = {
+    "خرسانة مسلحة": (range(200, 650, 50), range(250, 1250, 50)),
+    "خشب": ((50, 75, 100, 125, 150, 200, 250, 300), range(100, 625, 25)),
+}
+
+@st.cache_data
+def build_section_catalog(material):
+    # Precompute A, I, S and weight for every catalog section of a material,
+    # sorted by weight so the first section that passes is the lightest one
+    if material == "صلب":
+        names = list(STEEL_SHAPES)
+        h, b, tw, tf = (np.array(dim) / 1000 for dim in zip(*STEEL_SHAPES.values()))
+        hw = h - 2 * tf
+        A = 2 * b * tf + hw * tw
+        I = (b * h**3 - (b - tw) * hw**3) / 12
+    else:
+        widths, depths = RECT_SIZES[material]
+        b, h = (grid.ravel() / 1000 for grid in np.meshgrid(widths, depths))
+        names = [f"{bi*1000:.0f}×{hi*1000:.0f}" for bi, hi in zip(b, h)]
+        A = b * h
+        I = b * h**3 / 12
+
+    catalog = pd.DataFrame({
+        'name': names,
+        'b': b,
+        'h': h,
+        'A': A,
+        'I': I,
+        'S': I / (h / 2),
+        'weight': A * MATERIALS[material]['density'],
+    })
+    return catalog.sort_values(['weight', 'S'], kind='stable', ignore_index=True)
+
+def beam_demand(structure_type, length, point_load, distributed_load, load_position):
+    # Returns the maximum moment (N⋅m) and E⋅I⋅deflection (N⋅m³), so the
+    # deflection of any section is simply the second value / (E⋅I)
+    W_distributed = distributed_load * 1000 * length  # Total distributed load
+    P_point = point_load * 1000  # Point load
+
+    if "بسيطة" in structure_type:
+        # Simply supported beam
+        max_moment = (W_distributed * length / 8) + (P_point * load_position * (length - load_position) / length)
+        deflection_EI = (5 * W_distributed * length**4) / 384 + \
+                        (P_point * load_position * (length - load_position) * (length**2 - load_position**2 - (length - load_position)**2)) / (6 * length)
+    elif "كابولي" in structure_type:
+        # Cantilever beam
+        max_moment = (W_distributed * length**2 / 2) + (P_point * load_position)
+        deflection_EI = (W_distributed * length**4) / 8 + \
+                        (P_point * load_position**3) / 3
+    else:
+        # Continuous beam (simplified)
+        max_moment = (W_distributed * length**2 / 12) + (P_point * length / 8)
+        deflection_EI = (W_distributed * length**4) / 384 + \
+                        (P_point * length**3) / 192
+
+    return max_moment, deflection_EI
+
+def select_lightest_section(catalog, required_S, required_I):
+    # Vectorized filter over the weight-sorted catalog; returns None if no section passes
+    passes = (catalog['S'].to_numpy() >= required_S) & (catalog['I'].to_numpy() >= required_I)
+    if not passes.any():
+        return None
+    return catalog.iloc[int(np.argmax(passes))]
+
+def analyze_beam(structure_type, material, length, width, height, point_load, distributed_load,
+                 load_position, safety_factor, auto_size=False, deflection_ratio=250):
+    # Beam results for the given rectangle, or for the lightest catalog section when auto-sizing
+    E = MATERIALS[material]['E']
+    allowable_stress = MATERIALS[material]['allowable_stress']
+    
+    # Calculate maximum moment and deflection demand
+    max_moment, deflection_EI = beam_demand(
+        structure_type, length, point_load, distributed_load, load_position
+    )
+    
+    # Section properties
+    section = None
+    if auto_size:
+        section = select_lightest_section(
+            build_section_catalog(material),
+            required_S=max_moment * safety_factor / allowable_stress,
+            required_I=deflection_EI / (E * length / deflection_ratio)
+        )
+    
+    if section is not None:
+        width, height = float(section['b']), float(section['h'])
+        I, S = float(section['I']), float(section['S'])
+    else:
+        I = (width * height**3) / 12
+        S = I / (height / 2)
+    
+    # Calculate stress
+    max_stress = max_moment / S
+    return {
+        'section': section,
+        'width': width,
+        'height': height,
+        'I': I,
+        'S': S,
+        'max_moment': max_moment,
+        'max_deflection': deflection_EI / (E * I),
+        'max_stress': max_stress,
+        'safety_factor': allowable_stress / max_stress if max_stress > 0 else float('inf')
+    }
+
+# Column schedule columns: id, b (m), h (m), length (m), axial_load (kN), moment (kN⋅m)
+# and optionally k_factor (defaults to 1.0)
+COLUMN_SCHEDULE_COLUMNS = ['id', 'b', 'h', 'length', 'axial_load', 'moment']
+COLUMN_SCHEDULE_OPTIONAL = ['k_factor']
+
+def invalid_column_rows(schedule):
+    # Labels of rows with a missing id, missing or non-positive dimensions,
+    # or missing or negative loads; these cannot be checked safely.
+    # A blank k_factor is not an error - it defaults to 1.0
+    dims = ['b', 'h', 'length'] + [c for c in COLUMN_SCHEDULE_OPTIONAL if c in schedule]
+    values = schedule[dims + ['axial_load', 'moment']].apply(pd.to_numeric, errors='coerce')
+    if 'k_factor' in schedule:
+        values['k_factor'] = values['k_factor'].where(schedule['k_factor'].notna(), 1.0)
+    bad = (
+        schedule['id'].isna()
+        | values.isna().any(axis=1)
+        | (values[dims] <= 0).any(axis=1)
+        | (values['axial_load'] < 0)
+    )
+    return [
+        str(row_id) if pd.notna(row_id) else f"صف {position + 1}"
+        for position, row_id in enumerate(schedule['id']) if bad.iloc[position]
+    ]
+
+def check_columns(schedule, material, safety_factor):
+    # Axial, Euler buckling and axial + bending interaction check for a whole
+    # column schedule at once; returns the schedule sorted by utilization
+    props = MATERIALS[material]
+    b = schedule['b'].to_numpy(dtype=float)
+    h = schedule['h'].to_numpy(dtype=float)
+    k_factor = schedule['k_factor'].fillna(1.0).to_numpy(dtype=float) if 'k_factor' in schedule else np.ones(len(schedule))
+    effective_length = k_factor * schedule['length'].to_numpy(dtype=float)
+    P = schedule['axial_load'].to_numpy(dtype=float) * 1000
+    M = np.abs(schedule['moment'].to_numpy(dtype=float)) * 1000
+
+    # Section properties: buckling about the weak axis, bending about the strong axis
+    short, deep = np.minimum(b, h), np.maximum(b, h)
+    area = b * h
+    I_min = deep * short**3 / 12
+    S_major = short * deep**2 / 6
+    slenderness = effective_length / np.sqrt(I_min / area)
+
+    # Capacities
+    P_crushing = props['allowable_stress'] * area / safety_factor
+    P_euler = np.pi**2 * props['E'] * I_min / effective_length**2
+    P_allow = np.minimum(P_crushing, P_euler / safety_factor)
+    M_allow = props['allowable_stress'] * S_major / safety_factor
+
+    # Combined interaction with P-delta moment amplification; a column loaded
+    # at or beyond its Euler load has buckled regardless of the moment
+    buckled = P >= P_euler
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amplification = 1 / (1 - P / P_euler)
+        utilization = np.where(buckled, np.inf, P / P_allow + M * amplification / M_allow)
+
+    # Anything that is not demonstrably within capacity (including NaN) is unsafe
+    status = np.where(utilization <= 1.0, "آمن", "غير آمن")
+    status = np.where(slenderness > props['slenderness_limit'], "نحيف جدًا", status)
+
+    results = pd.DataFrame({
+        'id': schedule['id'].to_numpy(),
+        'slenderness': slenderness,
+        'P_allow': P_allow / 1000,
+        'P_euler': P_euler / 1000,
+        'M_allow': M_allow / 1000,
+        'utilization': utilization,
+        'status': status,
+    })
+    return results.sort_values(
+        'utilization', ascending=False, na_position='first', kind='stable', ignore_index=True
+    )
+
+# Activity table columns: id, name, duration (days), predecessors, progress (%)
+ACTIVITY_COLUMNS = ['id', 'name', 'duration', 'predecessors', 'progress']
+
+# Critical Path Method schedule for a project's activities (durations in days)
+class CPMSchedule:
+    def __init__(self, activities):
+        # activities: {activity_id: {'name', 'duration', 'predecessors', 'progress'}}
+        self.ids = list(activities)
+        self.index = {activity_id: i for i, activity_id in enumerate(self.ids)}
+        self.names = [a.get('name', activity_id) for activity_id, a in activities.items()]
+        self.duration = np.array([float(a.get('duration', 0)) for a in activities.values()])
+        self.progress = np.array([float(a.get('progress', 0)) for a in activities.values()])
+
+        self.predecessors = [[] for _ in self.ids]
+        self.successors = [[] for _ in self.ids]
+        for i, activity in enumerate(activities.values()):
+            for predecessor in activity.get('predecessors', []):
+                if predecessor not in self.index:
+                    raise ValueError(f"النشاط السابق غير موجود: {predecessor}")
+                self.predecessors[i].append(self.index[predecessor])
+                self.successors[self.index[predecessor]].append(i)
+
+        self.order = self._topological_order()
+        self.position = np.empty(len(self.ids), dtype=int)
+        self.position[self.order] = np.arange(len(self.ids))
+
+        n = len(self.ids)
+        self.es, self.ef = np.zeros(n), np.zeros(n)
+        self.ls, self.lf = np.zeros(n), np.zeros(n)
+        self._forward_pass()
+        self._backward_pass()
+
+    def _topological_order(self):
+        # Kahn's algorithm, O(activities + dependencies)
+        in_degree = [len(p) for p in self.predecessors]
+        order = [i for i, d in enumerate(in_degree) if d == 0]
+        for i in order:
+            for s in self.successors[i]:
+                in_degree[s] -= 1
+                if in_degree[s] == 0:
+                    order.append(s)
+        if len(order) != len(self.ids):
+            raise ValueError("يوجد تبعية دائرية بين الأنشطة")
+        return np.array(order, dtype=int)
+
+    def _forward_pass(self):
+        for i in self.order:
+            self.es[i] = max((self.ef[p] for p in self.predecessors[i]), default=0.0)
+            self.ef[i] = self.es[i] + self.duration[i]
+        self.finish = self.ef.max() if len(self.ids) else 0.0
+
+    def _backward_pass(self):
+        for i in self.order[::-1]:
+            self.lf[i] = min((self.ls[s] for s in self.successors[i]), default=self.finish)
+            self.ls[i] = self.lf[i] - self.duration[i]
+
+    def _propagate(self, start, forward):
+        # Recompute only the activities reachable from `start`, visiting them in
+        # topological order and stopping wherever the dates stay unchanged
+        heap = [(self.position[start] if forward else -self.position[start], start)]
+        queued = {start}
+        while heap:
+            _, i = heapq.heappop(heap)
+            if forward:
+                es = max((self.ef[p] for p in self.predecessors[i]), default=0.0)
+                changed = es + self.duration[i] != self.ef[i]
+                self.es[i], self.ef[i] = es, es + self.duration[i]
+                neighbours = self.successors[i]
+            else:
+                lf = min((self.ls[s] for s in self.successors[i]), default=self.finish)
+                changed = lf - self.duration[i] != self.ls[i]
+                self.lf[i], self.ls[i] = lf, lf - self.duration[i]
+                neighbours = self.predecessors[i]
+            if changed:
+                for n in neighbours:
+                    if n not in queued:
+                        queued.add(n)
+                        heapq.heappush(heap, (self.position[n] if forward else -self.position[n], n))
+
+    def update_activity(self, activity_id, duration=None, progress=None):
+        i = self.index[activity_id]
+        if progress is not None:
+            self.progress[i] = float(progress)
+        if duration is not None and float(duration) != self.duration[i]:
+            self.duration[i] = float(duration)
+            self._propagate(i, forward=True)
+            finish = self.ef.max()
+            if finish != self.finish:
+                # Every late date hangs off the project finish
+                self.finish = finish
+                self._backward_pass()
+            else:
+                self._propagate(i, forward=False)
+
+    @property
+    def total_float(self):
+        return self.ls - self.es
+
+    @property
+    def critical(self):
+        return self.total_float <= 1e-9
+
+    @property
+    def percent_complete(self):
+        total = self.duration.sum()
+        return float(self.duration @ self.progress / total) if total > 0 else 0.0
+
+    def planned_progress(self, elapsed_days):
+        # Percent of each activity that should be done after `elapsed_days`
+        with np.errstate(divide='ignore', invalid='ignore'):
+            planned = np.clip((elapsed_days - self.es) / self.duration, 0.0, 1.0)
+        planned = np.where(self.duration > 0, planned, (elapsed_days >= self.es).astype(float))
+        return planned * 100
+
+    def earned_schedule(self, weights):
+        # Day on the early-date plan at which the weighted planned progress equals
+        # the actual progress; bisection works because planned progress never decreases
+        total = weights.sum()
+        earned = weights @ self.progress / total
+        low, high = 0.0, self.finish
+        for _ in range(50):
+            middle = (low + high) / 2
+            if weights @ self.planned_progress(middle) / total < earned:
+                low = middle
+            else:
+                high = middle
+        return high
+
+    def status(self, start_date, today=None):
+        # Planned vs actual progress, the schedule slip along the critical path
+        # and the critical activities behind it, worst shortfall first
+        elapsed = ((today or datetime.now()) - start_date).days
+        planned = self.planned_progress(elapsed)
+        total = self.duration.sum()
+        planned_percent = float(self.duration @ planned / total) if total > 0 else 0.0
+        late = self.critical & (self.progress < planned)
+        late_idx = np.flatnonzero(late)
+        shortfall = (planned[late_idx] - self.progress[late_idx]) / 100 * self.duration[late_idx]
+
+        # Slip = elapsed days minus the earned schedule of the critical work
+        critical_weights = np.where(self.critical, self.duration, 0.0)
+        delay_days = 0.0
+        if critical_weights.sum() > 0 and critical_weights @ self.progress < critical_weights @ planned:
+            delay_days = max(0.0, elapsed - self.earned_schedule(critical_weights))
+
+        return {
+            'planned_progress': planned_percent,
+            'actual_progress': self.percent_complete,
+            'late_critical': [self.names[i] for i in late_idx[np.argsort(-shortfall)]],
+            'delay_days': float(delay_days),
+        }
+
+    def to_frame(self):
+        return pd.DataFrame({
+            'id': self.ids,
+            'name': self.names,
+            'duration': self.duration,
+            'progress': self.progress,
+            'es': self.es,
+            'ef': self.ef,
+            'ls': self.ls,
+            'lf': self.lf,
+            'total_float': self.total_float,
+            'critical': self.critical,
+        })
+
+def activity_key(value):
+    # Numeric ids from MS Project/Primavera exports may arrive as 1.0 - keep them as "1"
+    return re.sub(r'^(-?\d+)\.0+$', r'\1', str(value).strip())
+
+def activities_from_frame(frame):
+    # Table rows (id, name, duration, predecessors as "A, B", progress) -> activities dict
+    frame = frame.reindex(columns=ACTIVITY_COLUMNS).dropna(subset=['id'])
+    frame = frame.fillna({'duration': 0, 'progress': 0, 'predecessors': ''})
+    activities = {}
+    for row in frame.to_dict('records'):
+        activity_id = activity_key(row['id'])
+        activities[activity_id] = {
+            'name': str(row['name']) if pd.notna(row['name']) else activity_id,
+            'duration': float(row['duration']),
+            'predecessors': [activity_key(p) for p in str(row['predecessors']).split(',') if p.strip()],
+            'progress': min(max(float(row['progress']), 0.0), 100.0),
+        }
+    
+    duplicated = frame['id'].map(activity_key)
+    duplicated = sorted(set(duplicated[duplicated.duplicated()]))
+    if duplicated:
+        raise ValueError(f"معرفات أنشطة مكررة: {', '.join(duplicated[:20])}")
+    
+    negative = [activity_id for activity_id, a in activities.items() if a['duration'] < 0]
+    if negative:
+        raise ValueError(f"مدة سالبة للأنشطة: {', '.join(negative[:20])}")
+    return activities
+
+def read_activities_file(uploaded_file):
+    # Ids and predecessors stay text so blank cells do not turn them into floats
+    dtype = {'id': str, 'predecessors': str}
+    if uploaded_file.name.endswith('.csv'):
+        return pd.read_csv(uploaded_file, dtype=dtype)
+    return pd.read_excel(uploaded_file, dtype=dtype)
+
+def project_start_date(project):
+    return datetime.fromisoformat(project.get('start_date') or project['created'][:10])
+
+def gantt_chart(schedule, start_date, max_rows=500, critical_only=False):
+    # A single horizontal bar trace keeps the chart light even for large schedules
+    frame = schedule.to_frame()
+    if critical_only:
+        frame = frame[frame['critical']]
+    frame = frame.sort_values(['es', 'ef'], kind='stable').head(max_rows)
+
+    day_ms = 24 * 60 * 60 * 1000
+    fig = go.Figure(go.Bar(
+        y=frame['name'].astype(str),
+        x=frame['duration'] * day_ms,
+        base=pd.Timestamp(start_date) + pd.to_timedelta(frame['es'], unit='D'),
+        orientation='h',
+        marker_color=np.where(frame['critical'], '#ef4444', '#1e40af'),
+        customdata=np.stack([frame['progress'], frame['total_float']], axis=-1),
+        hovertemplate="%{y}<br>التقدم: %{customdata[0]:.0f}%<br>الفائض: %{customdata[1]:.0f} يوم<extra></extra>"
+    ))
+    fig.update_layout(
+        title="مخطط جانت - المسار الحرج باللون الأحمر",
+        xaxis_type='date',
+        yaxis_autorange='reversed',
+        height=max(400, 22 * len(frame)),
+        showlegend=False
+    )
+    return fig
+
+# Excel report columns: (header, project key, format name)
+PORTFOLIO_COLUMNS = [
+    ('المشروع', 'name', None), ('الموقع', 'location', None), ('العميل', 'client', None),
+    ('النوع', 'type', None), ('المساحة (م²)', 'area', 'number'), ('القيمة (ر.س)', 'value', 'money'),
+    ('الحالة', 'status', None), ('التقدم %', 'progress', 'number'), ('تاريخ البدء', 'start_date', None),
+]
+
+def write_report(path, projects, analyses):
+    # Rows are streamed to disk as they are written (constant_memory), so the
+    # workbook is never held in RAM however large the portfolio is
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True})
+    formats = {
+        'title': workbook.add_format({'bold': True, 'font_size': 16, 'font_color': '#1e40af'}),
+        'header': workbook.add_format({'bold': True, 'bg_color': '#1e40af', 'font_color': 'white', 'border': 1}),
+        'number': workbook.add_format({'num_format': '#,##0.00'}),
+        'money': workbook.add_format({'num_format': '#,##0'}),
+    }
+
+    def add_sheet(name, headers):
+        sheet = workbook.add_worksheet(name)
+        sheet.right_to_left()
+        sheet.set_column(0, len(headers) - 1, 18)
+        sheet.write_row(0, 0, headers, formats['header'])
+        sheet.freeze_panes(1, 0)
+        return sheet
+
+    # Summary sheet, aggregated in a single pass over the projects
+    by_status = {}
+    total_value = total_progress = 0
+    for project in projects:
+        status = project.get('status', 'غير محدد')
+        count, value = by_status.get(status, (0, 0))
+        by_status[status] = (count + 1, value + project.get('value', 0))
+        total_value += project.get('value', 0)
+        total_progress += project.get('progress', 0)
+
+    summary = workbook.add_worksheet('الملخص')
+    summary.right_to_left()
+    summary.set_column(0, 2, 22)
+    summary.write(0, 0, 'تقرير AN.AI AHMED NOUFAL', formats['title'])
+    summary.write(1, 0, datetime.now().strftime('%Y-%m-%d %H:%M'))
+    summary_rows = [
+        ('المشاريع الكلية', len(projects)),
+        ('القيمة الإجمالية (ر.س)', total_value),
+        ('متوسط التقدم %', total_progress / len(projects) if projects else 0),
+        ('التحليلات المحفوظة', len(analyses)),
+    ]
+    for row, (label, value) in enumerate(summary_rows, start=3):
+        summary.write(row, 0, label)
+        summary.write_number(row, 1, value, formats['number'])
+
+    status_row = 3 + len(summary_rows) + 1
+    summary.write_row(status_row, 0, ['الحالة', 'عدد المشاريع', 'القيمة (ر.س)'], formats['header'])
+    for row, (status, (count, value)) in enumerate(by_status.items(), start=status_row + 1):
+        summary.write(row, 0, status)
+        summary.write_number(row, 1, count)
+        summary.write_number(row, 2, value, formats['money'])
+
+    if by_status:
+        first, last = status_row + 1, status_row + len(by_status)
+        pie = workbook.add_chart({'type': 'pie'})
+        pie.add_series({
+            'name': 'توزيع حالة المشاريع',
+            'categories': ['الملخص', first, 0, last, 0],
+            'values': ['الملخص', first, 1, last, 1],
+            'data_labels': {'percentage': True},
+        })
+        pie.set_title({'name': 'توزيع حالة المشاريع'})
+        summary.insert_chart(3, 4, pie)
+
+        column = workbook.add_chart({'type': 'column'})
+        column.add_series({
+            'name': 'القيمة حسب الحالة',
+            'categories': ['الملخص', first, 0, last, 0],
+            'values': ['الملخص', first, 2, last, 2],
+            'fill': {'color': '#1e40af'},
+        })
+        column.set_title({'name': 'القيمة حسب الحالة'})
+        column.set_legend({'none': True})
+        summary.insert_chart(19, 4, column)
+
+    # Project portfolio
+    portfolio = add_sheet('المشاريع', [header for header, _, _ in PORTFOLIO_COLUMNS])
+    for row, project in enumerate(projects, start=1):
+        for col, (_, key, fmt) in enumerate(PORTFOLIO_COLUMNS):
+            value = project.get(key)
+            if fmt and value is not None:
+                portfolio.write_number(row, col, value, formats[fmt])
+            elif value is not None:
+                portfolio.write_string(row, col, str(value))
+    if projects:
+        progress_col = [key for _, key, _ in PORTFOLIO_COLUMNS].index('progress')
+        portfolio.conditional_format(1, progress_col, len(projects), progress_col, {
+            'type': 'data_bar', 'bar_color': '#10b981', 'min_type': 'num', 'min_value': 0,
+            'max_type': 'num', 'max_value': 100
+        })
+        portfolio.autofilter(0, 0, len(projects), len(PORTFOLIO_COLUMNS) - 1)
+
+    # Excel analysis statistics
+    excel_sheet = add_sheet('تحليلات Excel', ['الملف', 'التاريخ', 'العمود', 'المجموع', 'المتوسط', 'الحد الأدنى', 'الحد الأقصى'])
+    row = 1
+    for analysis in analyses:
+        if analysis.get('type') != 'excel_analysis':
+            continue
+        for col_stats in analysis.get('column_stats', []):
+            excel_sheet.write_string(row, 0, analysis.get('filename', ''))
+            excel_sheet.write_string(row, 1, analysis.get('timestamp', ''))
+            excel_sheet.write_string(row, 2, col_stats['column'])
+            for col, key in enumerate(['sum', 'mean', 'min', 'max'], start=3):
+                excel_sheet.write_number(row, col, col_stats[key], formats['number'])
+            row += 1
+
+    # Structural results
+    structural_sheet = add_sheet('التحليل الإنشائي', [
+        'التاريخ', 'نوع الهيكل', 'المادة', 'المقطع', 'الطول (م)', 'أقصى عزم (kN⋅m)',
+        'أقصى انحناء (mm)', 'أقصى إجهاد (MPa)', 'معامل الأمان'
+    ])
+    row = 1
+    for analysis in analyses:
+        if analysis.get('type') != 'structural_analysis':
+            continue
+        results = analysis['results']
+        structural_sheet.write_row(row, 0, [
+            analysis.get('timestamp', ''), analysis['structure_type'], analysis['material'],
+            analysis.get('section') or '-'
+        ])
+        structural_sheet.write_row(row, 4, [
+            analysis['dimensions']['length'], results['max_moment'] / 1000, results['max_deflection'] * 1000,
+            results['max_stress'] / 1e6, results['safety_factor']
+        ], formats['number'])
+        row += 1
+
+    if row > 1:
+        chart = workbook.add_chart({'type': 'column'})
+        chart.add_series({
+            'name': 'معامل الأمان',
+            'categories': ['التحليل الإنشائي', 1, 0, row - 1, 0],
+            'values': ['التحليل الإنشائي', 1, 8, row - 1, 8],
+            'fill': {'color': '#ef4444'},
+        })
+        chart.set_title({'name': 'معامل الأمان لكل تحليل'})
+        chart.set_legend({'none': True})
+        structural_sheet.insert_chart(1, 10, chart)
+
+    # Column schedule checks
+    column_sheet = add_sheet('فحص الأعمدة', [
+        'التاريخ', 'المادة', 'عدد الأعمدة', 'أعمدة غير آمنة', 'أقصى نسبة استغلال'
+    ])
+    row = 1
+    for analysis in analyses:
+        if analysis.get('type') != 'column_check':
+            continue
+        column_sheet.write_row(row, 0, [analysis.get('timestamp', ''), analysis['material']])
+        column_sheet.write_number(row, 2, analysis['columns'])
+        column_sheet.write_number(row, 3, analysis['unsafe_columns'])
+        if np.isfinite(analysis['max_utilization']):
+            column_sheet.write_number(row, 4, analysis['max_utilization'], formats['number'])
+        else:
+            # Buckled column: the load is at or beyond the Euler load
+            column_sheet.write_string(row, 4, '∞')
+        row += 1
+
+    workbook.close()
+    return path
+
+REPORT_PREFIX = 'anai_report_'
+
+def sweep_old_reports(max_age_hours=24):
+    # Remove report files left behind by finished or abandoned sessions
+    cutoff = time.time() - max_age_hours * 3600
+    for name in os.listdir(tempfile.gettempdir()):
+        path = os.path.join(tempfile.gettempdir(), name)
+        if name.startswith(REPORT_PREFIX) and name.endswith('.xlsx') and os.path.getmtime(path) < cutoff:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def discard_report():
+    # Download callback: the file has been served, so drop it and the job
+    report_job = st.session_state.pop('anai_report_job', None)
+    if report_job is not None and os.path.exists(report_job['path']):
+        os.remove(report_job['path'])
+
+# Uploaded workbooks are cached across sessions, so keep the cache bounded
+@st.cache_data(max_entries=16, ttl=3600)
+def load_excel(file_bytes):
+    return pd.read_excel(BytesIO(file_bytes))
+
+@st.cache_data(max_entries=16, ttl=3600)
+def numeric_summary(df):
+    numeric = df.select_dtypes(include=[np.number])
+    return pd.DataFrame({
+        'column': numeric.columns.astype(str),
+        'sum': numeric.sum().to_numpy(),
+        'mean': numeric.mean().to_numpy(),
+        'min': numeric.min().to_numpy(),
+        'max': numeric.max().to_numpy(),
+    })
+
+@st.cache_resource
+def report_executor():
+    # Shared worker pool so report generation never blocks a script run
+    return ThreadPoolExecutor(max_workers=2)
+
 # Initialize database
 if 'anai_db' not in st.session_state:
     st.session_state.anai_db = ANAIDatabase()
@@ -231,6 +928,360 @@ with st.sidebar:
         st.metric("نشط", stats['active_projects'])
         st.metric("التقدم", f"{stats['avg_progress']:.0f}%")
 
+# Interactive panels run as fragments: a widget change reruns only the panel,
+# not the header, sidebar stats and navigation around it
+@st.fragment
+def structural_analysis_panel():
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("### 📐 بيانات الهيكل")
+        
+        structure_type = st.selectbox(
+            "نوع الهيكل:",
+            ["كمرة بسيطة", "كمرة كابولي", "كمرة مستمرة", "عمود"]
+        )
+        
+        length = st.number_input("الطول (م):", value=6.0, min_value=1.0, max_value=20.0)
+        width = st.number_input("العرض (م):", value=0.3, min_value=0.1, max_value=2.0)
+        height = st.number_input("الارتفاع (م):", value=0.5, min_value=0.1, max_value=2.0)
+        
+        material = st.selectbox(
+            "المادة:",
+            list(MATERIALS)
+        )
+        
+        is_column = structure_type == "عمود"
+        auto_size = st.checkbox(
+            "📏 اختيار المقطع تلقائيًا من الكتالوج",
+            help="اختيار أخف مقطع قياسي يحقق العزم المطلوب وحد الانحناء",
+            disabled=is_column
+        )
+        deflection_ratio = st.selectbox(
+            "حد الانحناء المسموح (L/):",
+            [250, 300, 360, 500],
+            disabled=not auto_size
+        )
+    
+    with col2:
+        st.markdown("### 🏋 الأحمال")
+        
+        if is_column:
+            axial_load = st.number_input("الحمل المحوري (kN):", value=500.0, min_value=0.0)
+            column_moment = st.number_input("العزم (kN⋅m):", value=20.0, min_value=0.0)
+            k_factor = st.selectbox("معامل الطول الفعال K:", [0.65, 0.8, 1.0, 1.2, 2.0], index=2)
+        else:
+            point_load = st.number_input("الحمل المركز (kN):", value=10.0, min_value=0.0)
+            distributed_load = st.number_input("الحمل الموزع (kN/m):", value=5.0, min_value=0.0)
+            
+            load_position = st.slider(
+                "موقع الحمل المركز:",
+                min_value=0.0,
+                max_value=length,
+                value=length/2,
+                step=0.1
+            )
+        
+        safety_factor = st.number_input("معامل الأمان:", value=2.5, min_value=1.0, max_value=5.0)
+    
+    # Live preview of the current inputs
+    if is_column:
+        preview = check_columns(pd.DataFrame([{
+            'id': 'C1', 'b': width, 'h': height, 'length': length,
+            'axial_load': axial_load, 'moment': column_moment, 'k_factor': k_factor
+        }]), material, safety_factor).iloc[0]
+        st.info(
+            f"⚡ معاينة فورية: نسبة الاستغلال {preview['utilization']:.2f} | "
+            f"النحافة KL/r {preview['slenderness']:.0f} | {preview['status']}"
+        )
+    else:
+        preview = analyze_beam(
+            structure_type, material, length, width, height, point_load, distributed_load,
+            load_position, safety_factor, auto_size, deflection_ratio
+        )
+        preview_section = f" | المقطع {preview['section']['name']}" if preview['section'] is not None else ""
+        st.info(
+            f"⚡ معاينة فورية: العزم {preview['max_moment']/1000:.1f} kN⋅m | "
+            f"الانحناء {preview['max_deflection']*1000:.2f} mm | "
+            f"الإجهاد {preview['max_stress']/1e6:.1f} MPa | "
+            f"معامل الأمان {preview['safety_factor']:.1f}{preview_section}"
+        )
+    
+    if is_column:
+        schedule_file = st.file_uploader(
+            "📋 جدول الأعمدة (اختياري):",
+            type=['xlsx', 'xls', 'csv'],
+            help="أعمدة الجدول: " + ", ".join(COLUMN_SCHEDULE_COLUMNS) + " و " + ", ".join(COLUMN_SCHEDULE_OPTIONAL) + " (اختياري) - الأبعاد بالمتر والأحمال بـ kN"
+        )
+    
+    run_analysis = st.button("🚀 تشغيل التحليل الإنشائي", type="primary")
+    
+    # Results stay visible across the app rerun that follows a save, until an input changes
+    if is_column:
+        inputs = (structure_type, material, length, width, height, axial_load, column_moment,
+                  k_factor, safety_factor, schedule_file.file_id if schedule_file else None)
+    else:
+        inputs = (structure_type, material, length, width, height, point_load, distributed_load,
+                  load_position, safety_factor, auto_size, deflection_ratio)
+    if run_analysis:
+        st.session_state['structural_results_inputs'] = inputs
+    show_results = st.session_state.get('structural_results_inputs') == inputs
+    
+    if show_results and is_column:
+        with st.spinner("جاري فحص الأعمدة..."):
+            if schedule_file:
+                if schedule_file.name.endswith('.csv'):
+                    schedule = pd.read_csv(schedule_file)
+                else:
+                    schedule = pd.read_excel(schedule_file)
+            else:
+                schedule = pd.DataFrame([{
+                    'id': 'C1', 'b': width, 'h': height, 'length': length,
+                    'axial_load': axial_load, 'moment': column_moment, 'k_factor': k_factor
+                }])
+            
+            missing = [c for c in COLUMN_SCHEDULE_COLUMNS if c not in schedule.columns]
+            invalid = [] if missing else invalid_column_rows(schedule)
+            if missing:
+                st.error(f"❌ أعمدة ناقصة في الجدول: {', '.join(missing)}")
+            elif invalid:
+                st.error(
+                    f"❌ بيانات ناقصة أو غير صالحة في {len(invalid)} عمود - صحح الجدول وأعد المحاولة: "
+                    + ", ".join(invalid[:20]) + (" ..." if len(invalid) > 20 else "")
+                )
+            else:
+                results = check_columns(schedule, material, safety_factor)
+                unsafe = results['status'] != "آمن"
+                
+                st.markdown("### 📊 نتائج فحص الأعمدة")
+                
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("عدد الأعمدة", len(results))
+                with col2:
+                    st.metric("أعمدة غير آمنة", int(unsafe.sum()))
+                with col3:
+                    st.metric("أقصى نسبة استغلال", f"{results['utilization'].iloc[0]:.2f}")
+                with col4:
+                    st.metric("أقصى نحافة KL/r", f"{results['slenderness'].max():.0f}")
+                
+                if unsafe.any():
+                    st.error(f"❌ {int(unsafe.sum())} عمود لا يحقق متطلبات التحمل أو النحافة - الأعمدة مرتبة حسب الخطورة")
+                else:
+                    st.success("✅ جميع الأعمدة آمنة")
+                
+                st.dataframe(
+                    results.rename(columns={
+                        'id': 'العمود',
+                        'slenderness': 'النحافة KL/r',
+                        'P_allow': 'الحمل المسموح (kN)',
+                        'P_euler': 'حمل أويلر (kN)',
+                        'M_allow': 'العزم المسموح (kN⋅m)',
+                        'utilization': 'نسبة الاستغلال',
+                        'status': 'الحالة'
+                    }),
+                    column_config={
+                        column: st.column_config.NumberColumn(format="%.2f")
+                        for column in ['النحافة KL/r', 'الحمل المسموح (kN)', 'حمل أويلر (kN)',
+                                       'العزم المسموح (kN⋅m)', 'نسبة الاستغلال']
+                    },
+                    use_container_width=True
+                )
+                
+                # Most critical columns
+                critical = results.head(30)
+                buckled = np.isinf(critical['utilization'])
+                finite_max = critical['utilization'][~buckled].max()
+                bar_cap = max(2.0, finite_max if pd.notna(finite_max) else 0.0)
+                fig = go.Figure(go.Bar(
+                    x=critical['id'].astype(str),
+                    y=critical['utilization'].where(~buckled, bar_cap),
+                    text=np.where(buckled, "انبعاج", ""),
+                    marker_color=np.where(critical['status'] == "آمن", '#10b981', '#ef4444')
+                ))
+                fig.add_hline(y=1.0, line_dash='dash', line_color='#6b7280')
+                fig.update_layout(
+                    title="الأعمدة الأكثر حرجًا",
+                    xaxis_title="العمود",
+                    yaxis_title="نسبة الاستغلال",
+                    height=400
+                )
+                st.plotly_chart(fig, use_container_width=True)
+                
+                # Save analysis
+                analysis_id = f"column_{int(time.time())}"
+                analysis_data = {
+                    'type': 'column_check',
+                    'material': material,
+                    'columns': len(results),
+                    'unsafe_columns': int(unsafe.sum()),
+                    'max_utilization': float(results['utilization'].iloc[0])
+                }
+                if run_analysis:
+                    db.save_analysis(analysis_id, analysis_data)
+                    # Refresh the sidebar stats outside this fragment
+                    st.rerun(scope="app")
+    
+    elif show_results:
+        with st.spinner("جاري التحليل..."):
+            beam = analyze_beam(
+                structure_type, material, length, width, height, point_load, distributed_load,
+                load_position, safety_factor, auto_size, deflection_ratio
+            )
+            if auto_size and beam['section'] is None:
+                st.error(f"❌ لا يوجد مقطع في الكتالوج ({len(build_section_catalog(material))} مقطع) يحقق المتطلبات - سيتم استخدام الأبعاد المدخلة")
+            
+            section = beam['section']
+            width, height, I, S = beam['width'], beam['height'], beam['I'], beam['S']
+            max_moment = beam['max_moment']
+            max_deflection = beam['max_deflection']
+            max_stress = beam['max_stress']
+            actual_safety_factor = beam['safety_factor']
+            
+            # Display results
+            st.markdown("### 📊 نتائج التحليل")
+            
+            if section is not None:
+                st.success(
+                    f"📏 المقطع المختار: **{section['name']}** - الوزن {section['weight']:.1f} kg/m، "
+                    f"I = {I*1e8:,.0f} cm⁴، S = {S*1e6:,.0f} cm³"
+                )
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("أقصى عزم", f"{max_moment/1000:.1f} kN⋅m")
+            with col2:
+                st.metric("أقصى انحناء", f"{max_deflection*1000:.2f} mm")
+            with col3:
+                st.metric("أقصى إجهاد", f"{max_stress/1e6:.1f} MPa")
+            with col4:
+                st.metric("معامل الأمان", f"{actual_safety_factor:.1f}")
+            
+            # Safety assessment
+            if actual_safety_factor >= safety_factor:
+                st.success(f"✅ التصميم آمن - معامل الأمان الفعلي ({actual_safety_factor:.1f}) أكبر من المطلوب ({safety_factor})")
+            elif actual_safety_factor >= 1.0:
+                st.warning(f"⚠ التصميم مقبول ولكن يحتاج مراجعة - معامل الأمان ({actual_safety_factor:.1f}) أقل من المطلوب")
+            else:
+                st.error(f"❌ التصميم غير آمن - معامل الأمان ({actual_safety_factor:.1f}) أقل من 1.0")
+            
+            # Create deflection curve
+            st.markdown("### 📈 منحنى الانحناء")
+            x_points = np.linspace(0, length, 50)
+            y_points = []
+            
+            for x in x_points:
+                if "بسيطة" in structure_type:
+                    # Simplified deflection calculation
+                    deflection = max_deflection * 4 * (x/length) * (1 - x/length)
+                elif "كابولي" in structure_type:
+                    deflection = max_deflection * (x/length)**2
+                else:
+                    deflection = max_deflection * 4 * (x/length) * (1 - x/length) * 0.6
+                
+                y_points.append(-deflection * 1000)  # Convert to mm
+            
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(
+                x=x_points,
+                y=y_points,
+                mode='lines',
+                name='منحنى الانحناء',
+                line=dict(color='#ef4444', width=3)
+            ))
+            
+            fig.update_layout(
+                title="منحنى انحناء الكمرة",
+                xaxis_title="المسافة (م)",
+                yaxis_title="الانحناء (mm)",
+                height=400
+            )
+            
+            st.plotly_chart(fig, use_container_width=True)
+            
+            # Save analysis
+            analysis_id = f"structural_{int(time.time())}"
+            analysis_data = {
+                'type': 'structural_analysis',
+                'structure_type': structure_type,
+                'material': material,
+                'section': section['name'] if section is not None else None,
+                'dimensions': {'length': length, 'width': width, 'height': height},
+                'loads': {'point_load': point_load, 'distributed_load': distributed_load},
+                'results': {
+                    'max_moment': max_moment,
+                    'max_deflection': max_deflection,
+                    'max_stress': max_stress,
+                    'safety_factor': actual_safety_factor
+                }
+            }
+            if run_analysis:
+                db.save_analysis(analysis_id, analysis_data)
+                # Refresh the sidebar stats outside this fragment
+                st.rerun(scope="app")
+
+@st.fragment
+def excel_analysis_panel(df, filename, file_id):
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    
+    if st.button("🔍 تحليل متقدم", type="primary"):
+        # Save analysis
+        analysis_id = f"excel_{int(time.time())}"
+        analysis_data = {
+            'type': 'excel_analysis',
+            'filename': filename,
+            'rows': len(df),
+            'columns': len(df.columns),
+            'numeric_columns': len(numeric_cols),
+            'column_stats': numeric_summary(df).to_dict('records')
+        }
+        db.save_analysis(analysis_id, analysis_data)
+        st.session_state['excel_analysis_file'] = file_id
+        # Refresh the sidebar stats outside this fragment
+        st.rerun(scope="app")
+    
+    # Results stay open while the chart options change
+    if st.session_state.get('excel_analysis_file') == file_id:
+        st.info("💾 تم حفظ نتائج التحليل")
+        st.markdown("### 📊 نتائج التحليل")
+        
+        if len(numeric_cols) > 0:
+            st.markdown("#### الأعمدة الرقمية")
+            
+            summary = numeric_summary(df)
+            results_df = pd.DataFrame({
+                'العمود': summary['column'],
+                'المجموع': summary['sum'].map('{:,.2f}'.format),
+                'المتوسط': summary['mean'].map('{:,.2f}'.format),
+                'الحد الأدنى': summary['min'].map('{:,.2f}'.format),
+                'الحد الأقصى': summary['max'].map('{:,.2f}'.format)
+            })
+            st.dataframe(results_df, use_container_width=True)
+            
+            # Create visualization
+            if len(numeric_cols) >= 2:
+                col1, col2 = st.columns(2)
+                with col1:
+                    x_col = st.selectbox("المحور الأفقي:", list(numeric_cols), index=0)
+                with col2:
+                    y_col = st.selectbox("المحور الرأسي:", list(numeric_cols), index=1)
+                
+                fig = px.scatter(
+                    df, 
+                    x=x_col, 
+                    y=y_col,
+                    title=f"مخطط العلاقة بين {x_col} و {y_col}"
+                )
+                st.plotly_chart(fig, use_container_width=True)
+
+@st.fragment(run_every=2)
+def report_status_panel():
+    # Polls the background report; only rendered while the job is running
+    report_job = st.session_state.get('anai_report_job')
+    if report_job is None or report_job['future'].done():
+        st.rerun()
+    st.info("⏳ جاري إنشاء التقرير في الخلفية...")
+
 # Main content based on navigation
 if "الرئيسية" in page:
     st.markdown("## 📊 لوحة التحكم الرئيسية")
@@ -287,6 +1338,31 @@ if "الرئيسية" in page:
         )
         st.plotly_chart(fig, use_container_width=True)
     
+    # Schedule status of projects with activities
+    st.markdown("### ⏱ حالة الجداول الزمنية")
+    schedule_rows = []
+    for project_id, project in projects.items():
+        try:
+            schedule = db.get_schedule(project_id)
+        except ValueError:
+            continue
+        if schedule is None:
+            continue
+        schedule_status = schedule.status(project_start_date(project))
+        schedule_rows.append({
+            'المشروع': project['name'],
+            'التقدم المخطط': f"{schedule_status['planned_progress']:.0f}%",
+            'التقدم الفعلي': f"{schedule_status['actual_progress']:.0f}%",
+            'التأخير (يوم)': round(schedule_status['delay_days']),
+            'أسباب التأخير': "، ".join(schedule_status['late_critical'][:3]) or "-"
+        })
+    
+    if schedule_rows:
+        schedule_rows.sort(key=lambda row: row['التأخير (يوم)'], reverse=True)
+        st.dataframe(pd.DataFrame(schedule_rows), use_container_width=True)
+    else:
+        st.info("لا توجد مشاريع بجداول زمنية بعد. أضف الأنشطة من صفحة المشاريع.")
+    
     # Recent activity
     st.markdown("### 🕒 النشاط الأخير")
     st.info("✅ تم تشغيل النظام بنجاح")
@@ -310,6 +1386,7 @@ elif "المشاريع" in page:
                 project_type = st.selectbox("نوع المشروع:", ["سكني", "تجاري", "صناعي", "حكومي"])
                 area = st.number_input("المساحة (م²):", min_value=1.0, value=500.0)
                 value = st.number_input("القيمة المتوقعة (ر.س):", min_value=1000.0, value=500000.0)
+                start_date = st.date_input("تاريخ البدء:")
             
             if st.form_submit_button("إنشاء المشروع", type="primary"):
                 if name:
@@ -321,7 +1398,8 @@ elif "المشاريع" in page:
                         'area': area,
                         'value': value,
                         'status': 'نشط',
-                        'progress': 0
+                        'progress': 0,
+                        'start_date': start_date.isoformat()
                     }
                     
                     project_id = db.add_project(project_data)
@@ -357,6 +1435,96 @@ elif "المشاريع" in page:
                 st.markdown("---")
     else:
         st.info("لا توجد مشاريع حاليًا. أضف مشروعًا جديدًا للبدء.")
+    
+    # Activity schedule and critical path
+    if projects:
+        st.markdown("### 🗓 الجدول الزمني والمسار الحرج")
+        
+        schedule_project_id = st.selectbox(
+            "المشروع:",
+            list(projects),
+            format_func=lambda pid: projects[pid]['name'],
+            key="schedule_project"
+        )
+        project = projects[schedule_project_id]
+        
+        # Bumped after every import or save so the uploader and the editor start fresh
+        revision_key = f"schedule_revision_{schedule_project_id}"
+        revision = st.session_state.get(revision_key, 0)
+        
+        activities_file = st.file_uploader(
+            "📥 استيراد الأنشطة:",
+            type=['xlsx', 'xls', 'csv'],
+            help="أعمدة الجدول: " + ", ".join(ACTIVITY_COLUMNS) + " - الأنشطة السابقة مفصولة بفواصل",
+            key=f"activities_file_{schedule_project_id}_{revision}"
+        )
+        
+        # Import the uploaded file once, then clear the uploader
+        if activities_file:
+            try:
+                db.save_activities(schedule_project_id, activities_from_frame(read_activities_file(activities_file)))
+                st.session_state[revision_key] = revision + 1
+                st.rerun()
+            except ValueError as e:
+                st.error(f"خطأ في الجدول الزمني: {str(e)}")
+        
+        activities_df = pd.DataFrame(
+            [
+                {'id': activity_id, **activity, 'predecessors': ', '.join(activity['predecessors'])}
+                for activity_id, activity in project.get('activities', {}).items()
+            ],
+            columns=ACTIVITY_COLUMNS
+        )
+        edited_df = st.data_editor(
+            activities_df,
+            num_rows="dynamic",
+            use_container_width=True,
+            key=f"activities_editor_{schedule_project_id}_{revision}"
+        )
+        
+        if st.button("💾 حفظ الجدول الزمني", type="primary"):
+            try:
+                db.save_activities(schedule_project_id, activities_from_frame(edited_df))
+                st.session_state[revision_key] = revision + 1
+                st.success("✅ تم تحديث الجدول الزمني")
+                st.rerun()
+            except ValueError as e:
+                st.error(f"خطأ في الجدول الزمني: {str(e)}")
+        
+        try:
+            schedule = db.get_schedule(schedule_project_id)
+        except ValueError as e:
+            schedule = None
+            st.error(f"خطأ في الجدول الزمني: {str(e)}")
+        
+        if schedule is not None:
+            start = project_start_date(project)
+            schedule_status = schedule.status(start)
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("مدة المشروع", f"{schedule.finish:.0f} يوم")
+            with col2:
+                st.metric("تاريخ الانتهاء", (start + pd.Timedelta(days=schedule.finish)).strftime('%Y-%m-%d'))
+            with col3:
+                st.metric("الأنشطة الحرجة", int(schedule.critical.sum()))
+            with col4:
+                st.metric(
+                    "التقدم الفعلي",
+                    f"{schedule_status['actual_progress']:.0f}%",
+                    f"{schedule_status['actual_progress'] - schedule_status['planned_progress']:.0f}% عن المخطط"
+                )
+            
+            if schedule_status['late_critical']:
+                st.warning(
+                    f"⚠ المشروع متأخر حوالي {schedule_status['delay_days']:.0f} يوم بسبب الأنشطة الحرجة: "
+                    + "، ".join(schedule_status['late_critical'][:5])
+                )
+            
+            critical_only = st.checkbox("عرض المسار الحرج فقط", key="gantt_critical_only")
+            st.plotly_chart(gantt_chart(schedule, start, critical_only=critical_only), use_container_width=True)
+            if len(schedule.ids) > 500:
+                st.caption(f"يعرض المخطط أول 500 نشاط من {len(schedule.ids)} حسب تاريخ البدء")
 
 elif "Excel" in page:
     st.markdown("## 📊 تحليل ملفات Excel")
@@ -369,8 +1537,8 @@ elif "Excel" in page:
     
     if uploaded_file:
         try:
-            # Read Excel file
-            df = pd.read_excel(uploaded_file)
+            # Read Excel file (cached, so panel reruns do not parse it again)
+            df = load_excel(uploaded_file.getvalue())
             
             # Display file info
             col1, col2, col3, col4 = st.columns(4)
@@ -390,208 +1558,14 @@ elif "Excel" in page:
             st.dataframe(df.head(10), use_container_width=True)
             
             # Analysis options
-            if st.button("🔍 تحليل متقدم", type="primary"):
-                st.markdown("### 📊 نتائج التحليل")
-                
-                # Numeric analysis
-                numeric_cols = df.select_dtypes(include=[np.number]).columns
-                
-                if len(numeric_cols) > 0:
-                    st.markdown("#### الأعمدة الرقمية")
-                    
-                    analysis_results = []
-                    for col in numeric_cols:
-                        col_stats = {
-                            'العمود': col,
-                            'المجموع': f"{df[col].sum():,.2f}",
-                            'المتوسط': f"{df[col].mean():,.2f}",
-                            'الحد الأدنى': f"{df[col].min():,.2f}",
-                            'الحد الأقصى': f"{df[col].max():,.2f}"
-                        }
-                        analysis_results.append(col_stats)
-                    
-                    results_df = pd.DataFrame(analysis_results)
-                    st.dataframe(results_df, use_container_width=True)
-                    
-                    # Create visualization
-                    if len(numeric_cols) >= 2:
-                        fig = px.scatter(
-                            df, 
-                            x=numeric_cols[0], 
-                            y=numeric_cols[1],
-                            title=f"مخطط العلاقة بين {numeric_cols[0]} و {numeric_cols[1]}"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                
-                # Save analysis
-                analysis_id = f"excel_{int(time.time())}"
-                analysis_data = {
-                    'type': 'excel_analysis',
-                    'filename': uploaded_file.name,
-                    'rows': len(df),
-                    'columns': len(df.columns),
-                    'numeric_columns': len(numeric_cols)
-                }
-                db.save_analysis(analysis_id, analysis_data)
-                
-                st.info("💾 تم حفظ نتائج التحليل")
+            excel_analysis_panel(df, uploaded_file.name, uploaded_file.file_id)
         
         except Exception as e:
             st.error(f"خطأ في معالجة الملف: {str(e)}")
 
 elif "الإنشائي" in page:
     st.markdown("## 🔧 التحليل الإنشائي")
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("### 📐 بيانات الهيكل")
-        
-        structure_type = st.selectbox(
-            "نوع الهيكل:",
-            ["كمرة بسيطة", "كمرة كابولي", "كمرة مستمرة", "عمود"]
-        )
-        
-        length = st.number_input("الطول (م):", value=6.0, min_value=1.0, max_value=20.0)
-        width = st.number_input("العرض (م):", value=0.3, min_value=0.1, max_value=2.0)
-        height = st.number_input("الارتفاع (م):", value=0.5, min_value=0.1, max_value=2.0)
-        
-        material = st.selectbox(
-            "المادة:",
-            ["خرسانة مسلحة", "صلب", "خشب"]
-        )
-    
-    with col2:
-        st.markdown("### 🏋 الأحمال")
-        
-        point_load = st.number_input("الحمل المركز (kN):", value=10.0, min_value=0.0)
-        distributed_load = st.number_input("الحمل الموزع (kN/m):", value=5.0, min_value=0.0)
-        
-        load_position = st.slider(
-            "موقع الحمل المركز:",
-            min_value=0.0,
-            max_value=length,
-            value=length/2,
-            step=0.1
-        )
-        
-        safety_factor = st.number_input("معامل الأمان:", value=2.5, min_value=1.0, max_value=5.0)
-    
-    if st.button("🚀 تشغيل التحليل الإنشائي", type="primary"):
-        with st.spinner("جاري التحليل..."):
-            # Material properties
-            if material == "خرسانة مسلحة":
-                E = 30e9  # Pa
-                allowable_stress = 25e6  # Pa
-                density = 2400  # kg/m3
-            elif material == "صلب":
-                E = 200e9
-                allowable_stress = 250e6
-                density = 7850
-            else:  # خشب
-                E = 12e9
-                allowable_stress = 40e6
-                density = 600
-            
-            # Section properties
-            area = width * height
-            I = (width * height**3) / 12
-            
-            # Calculate maximum moment and deflection
-            W_distributed = distributed_load * 1000 * length  # Total distributed load
-            P_point = point_load * 1000  # Point load
-            
-            if "بسيطة" in structure_type:
-                # Simply supported beam
-                max_moment = (W_distributed * length / 8) + (P_point * load_position * (length - load_position) / length)
-                max_deflection = (5 * W_distributed * length**4) / (384 * E * I) + \
-                               (P_point * load_position * (length - load_position) * (length**2 - load_position**2 - (length - load_position)**2)) / (6 * E * I * length)
-            elif "كابولي" in structure_type:
-                # Cantilever beam
-                max_moment = (W_distributed * length**2 / 2) + (P_point * load_position)
-                max_deflection = (W_distributed * length**4) / (8 * E * I) + \
-                               (P_point * load_position**3) / (3 * E * I)
-            else:
-                # Continuous beam (simplified)
-                max_moment = (W_distributed * length**2 / 12) + (P_point * length / 8)
-                max_deflection = (W_distributed * length**4) / (384 * E * I) + \
-                               (P_point * length**3) / (192 * E * I)
-            
-            # Calculate stress
-            max_stress = (max_moment * height / 2) / I
-            actual_safety_factor = allowable_stress / max_stress if max_stress > 0 else float('inf')
-            
-            # Display results
-            st.markdown("### 📊 نتائج التحليل")
-            
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.metric("أقصى عزم", f"{max_moment/1000:.1f} kN⋅m")
-            with col2:
-                st.metric("أقصى انحناء", f"{max_deflection*1000:.2f} mm")
-            with col3:
-                st.metric("أقصى إجهاد", f"{max_stress/1e6:.1f} MPa")
-            with col4:
-                st.metric("معامل الأمان", f"{actual_safety_factor:.1f}")
-            
-            # Safety assessment
-            if actual_safety_factor >= safety_factor:
-                st.success(f"✅ التصميم آمن - معامل الأمان الفعلي ({actual_safety_factor:.1f}) أكبر من المطلوب ({safety_factor})")
-            elif actual_safety_factor >= 1.0:
-                st.warning(f"⚠ التصميم مقبول ولكن يحتاج مراجعة - معامل الأمان ({actual_safety_factor:.1f}) أقل من المطلوب")
-            else:
-                st.error(f"❌ التصميم غير آمن - معامل الأمان ({actual_safety_factor:.1f}) أقل من 1.0")
-            
-            # Create deflection curve
-            st.markdown("### 📈 منحنى الانحناء")
-            x_points = np.linspace(0, length, 50)
-            y_points = []
-            
-            for x in x_points:
-                if "بسيطة" in structure_type:
-                    # Simplified deflection calculation
-                    deflection = max_deflection * 4 * (x/length) * (1 - x/length)
-                elif "كابولي" in structure_type:
-                    deflection = max_deflection * (x/length)**2
-                else:
-                    deflection = max_deflection * 4 * (x/length) * (1 - x/length) * 0.6
-                
-                y_points.append(-deflection * 1000)  # Convert to mm
-            
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(
-                x=x_points,
-                y=y_points,
-                mode='lines',
-                name='منحنى الانحناء',
-                line=dict(color='#ef4444', width=3)
-            ))
-            
-            fig.update_layout(
-                title="منحنى انحناء الكمرة",
-                xaxis_title="المسافة (م)",
-                yaxis_title="الانحناء (mm)",
-                height=400
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Save analysis
-            analysis_id = f"structural_{int(time.time())}"
-            analysis_data = {
-                'type': 'structural_analysis',
-                'structure_type': structure_type,
-                'material': material,
-                'dimensions': {'length': length, 'width': width, 'height': height},
-                'loads': {'point_load': point_load, 'distributed_load': distributed_load},
-                'results': {
-                    'max_moment': max_moment,
-                    'max_deflection': max_deflection,
-                    'max_stress': max_stress,
-                    'safety_factor': actual_safety_factor
-                }
-            }
-            db.save_analysis(analysis_id, analysis_data)
+    structural_analysis_panel()
 
 elif "الذكاء" in page:
     st.markdown("## 🤖 تحليل بالذكاء الاصطناعي")
@@ -690,6 +1664,47 @@ elif "الإعدادات" in page:
                             st.error(message)
                     except Exception as e:
                         st.error(f"خطأ في الاستيراد: {str(e)}")
+        
+        # Excel report, generated in the background
+        st.markdown("### 📑 تقرير Excel")
+        report_job = st.session_state.get('anai_report_job')
+        
+        if st.button("📊 إنشاء تقرير Excel", disabled=report_job is not None and not report_job['future'].done()):
+            if report_job is not None and os.path.exists(report_job['path']):
+                os.remove(report_job['path'])
+            sweep_old_reports()
+            fd, report_path = tempfile.mkstemp(prefix=REPORT_PREFIX, suffix='.xlsx')
+            os.close(fd)
+            # Snapshot the data so the worker never reads session state
+            report_job = {
+                'path': report_path,
+                'future': report_executor().submit(
+                    write_report,
+                    report_path,
+                    [dict(p) for p in db.get_projects().values()],
+                    [dict(a) for a in db.get_analyses().values()]
+                )
+            }
+            st.session_state['anai_report_job'] = report_job
+        
+        if report_job is not None:
+            if not report_job['future'].done():
+                report_status_panel()
+            elif report_job['future'].exception() is not None:
+                st.error(f"خطأ في إنشاء التقرير: {report_job['future'].exception()}")
+            elif not os.path.exists(report_job['path']):
+                # Swept as stale or cleared from the temp dir before download
+                st.session_state.pop('anai_report_job', None)
+                st.warning("⚠ انتهت صلاحية ملف التقرير - يرجى إنشاء التقرير من جديد")
+            else:
+                with open(report_job['path'], 'rb') as report_file:
+                    st.download_button(
+                        "⬇ تحميل تقرير Excel",
+                        report_file,
+                        f"anai_report_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        on_click=discard_report
+                    )
 
 # Test all functionality button
 st.markdown("---")